@@ -9,11 +9,33 @@
 #define LED_DENIED 6
 #define LED_MASTER 5
 
+// Компактный протокол: 0x7E | тип | seq | длина | данные | CRC-8
+#define TEXT_BAUDRATE 9600
+#define FRAMED_BAUDRATE 115200
+#define FRAME_START 0x7E
+#define FRAME_MAX_PAYLOAD 64
+#define FRAMED_RESPONSE_TIMEOUT 1000
+#define RESCAN_GUARD_MS 2000
+#define LINK_TIMEOUT_MS 6000  // сервер шлет PING каждые 2 с; дольше тишины - возврат к тексту
+
 MFRC522 mfrc522(SS_PIN, RST_PIN);
 LiquidCrystal_I2C lcd(0x27, 16, 2);  // Адрес твоего LCD
 
+bool framedMode = false;
+byte txSeq = 0;
+
+// Состояние приема кадра
+byte rxBuf[FRAME_MAX_PAYLOAD + 4];
+byte rxPos = 0;
+bool rxActive = false;
+unsigned long lastFrameTime = 0;
+
+// Защита от повторного считывания без блокировки (для компактного протокола)
+String lastUid = "";
+unsigned long lastScanTime = 0;
+
 void setup() {
-  Serial.begin(9600);
+  Serial.begin(TEXT_BAUDRATE);
   SPI.begin();
   mfrc522.PCD_Init();
   
@@ -35,6 +57,11 @@ void setup() {
 }
 
 void loop() {
+  if (framedMode) {
+    loopFramed();
+    return;
+  }
+  
   // Считывание NFC метки
   if (mfrc522.PICC_IsNewCardPresent() && mfrc522.PICC_ReadCardSerial()) {
     String uid = getUID();
@@ -57,6 +84,40 @@ void loop() {
   }
 }
 
+void loopFramed() {
+  if (mfrc522.PICC_IsNewCardPresent() && mfrc522.PICC_ReadCardSerial()) {
+    String uid = getUID();
+    
+    // Та же карта в течение RESCAN_GUARD_MS игнорируется вместо delay(2000)
+    if (uid == lastUid && millis() - lastScanTime < RESCAN_GUARD_MS) {
+      mfrc522.PICC_HaltA();
+      return;
+    }
+    lastUid = uid;
+    
+    displayMessage("Card Detected", "Processing...");
+    
+    txSeq++;
+    sendFrame('U', txSeq, mfrc522.uid.uidByte, mfrc522.uid.size);
+    processResponse(waitForFrame(txSeq));
+    
+    mfrc522.PICC_HaltA();
+    displayMessage("System Ready", "Show NFC Tag...");
+    // Отсчет защиты от повторного считывания - с момента, когда карту снова можно приложить
+    lastScanTime = millis();
+  }
+  
+  // Ответы на старые запросы отбрасываются по seq, PING обрабатывается в readFrame
+  byte type, seq;
+  String payload;
+  readFrame(type, seq, payload);
+  
+  // Сервер перезапущен или ушел на 9600 - возвращаемся к тексту
+  if (millis() - lastFrameTime > LINK_TIMEOUT_MS) {
+    fallBackToText();
+  }
+}
+
 String getUID() {
   String content = "";
   for (byte i = 0; i < mfrc522.uid.size; i++) {
@@ -80,16 +141,141 @@ void waitForResponse() {
   }
 }
 
+String waitForFrame(byte expectedSeq) {
+  unsigned long startTime = millis();
+  while (millis() - startTime < FRAMED_RESPONSE_TIMEOUT) {
+    byte type, seq;
+    String payload;
+    if (readFrame(type, seq, payload) && seq == expectedSeq) {
+      return frameToResponse(type, payload);
+    }
+  }
+  return "ERROR:Timeout";
+}
+
+String frameToResponse(byte type, String payload) {
+  // Перевод кадра в текстовый ответ, чтобы переиспользовать processResponse
+  switch (type) {
+    case 'G': return "ACCESS_GRANTED:" + payload;
+    case 'D': return "ACCESS_DENIED";
+    case 'M': return String("MASTER_KEY:") + (payload.length() > 0 && payload[0] == 1 ? "ACTIVE" : "INACTIVE");
+    case 'R': return "REGISTERED:" + payload;
+    default:  return "ERROR:" + payload;
+  }
+}
+
+byte crc8(const byte *data, byte len) {
+  // CRC-8 (полином 0x07), совпадает с crc8() в nfc_server.py
+  byte crc = 0;
+  for (byte i = 0; i < len; i++) {
+    crc ^= data[i];
+    for (byte bit = 0; bit < 8; bit++) {
+      crc = (crc & 0x80) ? (crc << 1) ^ 0x07 : crc << 1;
+    }
+  }
+  return crc;
+}
+
+void sendFrame(byte type, byte seq, const byte *payload, byte len) {
+  byte body[FRAME_MAX_PAYLOAD + 3];
+  if (len > FRAME_MAX_PAYLOAD) len = FRAME_MAX_PAYLOAD;
+  body[0] = type;
+  body[1] = seq;
+  body[2] = len;
+  memcpy(body + 3, payload, len);
+  
+  Serial.write(FRAME_START);
+  Serial.write(body, len + 3);
+  Serial.write(crc8(body, len + 3));
+}
+
+bool readFrame(byte &type, byte &seq, String &payload) {
+  // Неблокирующий разбор: тип, seq, длина, данные, CRC
+  while (Serial.available() > 0) {
+    byte b = Serial.read();
+    
+    if (!rxActive) {
+      if (b == FRAME_START) {
+        rxActive = true;
+        rxPos = 0;
+      }
+      continue;
+    }
+    
+    rxBuf[rxPos++] = b;
+    
+    if (rxPos == 3 && rxBuf[2] > FRAME_MAX_PAYLOAD) {
+      rxActive = false;
+      continue;
+    }
+    
+    if (rxPos > 3 && rxPos == rxBuf[2] + 4) {
+      rxActive = false;
+      byte len = rxBuf[2];
+      if (crc8(rxBuf, len + 3) != rxBuf[len + 3]) continue;
+      
+      lastFrameTime = millis();
+      if (rxBuf[0] == 'P') {
+        // PING сервера - возвращаем с тем же seq
+        sendFrame('P', rxBuf[1], rxBuf, 0);
+        continue;
+      }
+      
+      type = rxBuf[0];
+      seq = rxBuf[1];
+      payload = "";
+      for (byte i = 0; i < len; i++) {
+        payload += (char)rxBuf[3 + i];
+      }
+      return true;
+    }
+  }
+  return false;
+}
+
+void switchToFramed(String request) {
+  // Запрос сервера "PROTO:FRAMED:<baud>" - подтверждаем и меняем скорость
+  long baud = request.substring(request.lastIndexOf(':') + 1).toInt();
+  if (baud != FRAMED_BAUDRATE) return;
+  
+  Serial.print("PROTO_OK:FRAMED:");
+  Serial.println(FRAMED_BAUDRATE);
+  Serial.flush();
+  Serial.end();
+  Serial.begin(FRAMED_BAUDRATE);
+  framedMode = true;
+  lastFrameTime = millis();
+}
+
+void fallBackToText() {
+  Serial.flush();
+  Serial.end();
+  Serial.begin(TEXT_BAUDRATE);
+  framedMode = false;
+  rxActive = false;
+  // Сервер после возврата к тексту ждет READY и снова предлагает протокол
+  Serial.println("READY");
+}
+
+void debugPrint(String message) {
+  // В компактном режиме порт занят кадрами - отладочный текст не отправляем
+  if (!framedMode) Serial.println(message);
+}
+
 void processResponse(String response) {
-  Serial.print("Server: ");
-  Serial.println(response);
+  if (response.startsWith("PROTO:FRAMED")) {
+    switchToFramed(response);
+    return;
+  }
+  
+  debugPrint("Server: " + response);
   
   if (response.startsWith("ACCESS_GRANTED")) {
     // Доступ разрешен
     String userName = extractUserName(response);
     digitalWrite(LED_GRANTED, HIGH);
     displayMessage("ACCESS GRANTED", userName);
-    Serial.println(">>> ACCESS GRANTED - Door opened");
+    debugPrint(">>> ACCESS GRANTED - Door opened");
     delay(3000);
     digitalWrite(LED_GRANTED, LOW);
   }
@@ -97,7 +283,7 @@ void processResponse(String response) {
     // Доступ запрещен
     digitalWrite(LED_DENIED, HIGH);
     displayMessage("ACCESS DENIED", "Unknown Card");
-    Serial.println(">>> ACCESS DENIED");
+    debugPrint(">>> ACCESS DENIED");
     delay(3000);
     digitalWrite(LED_DENIED, LOW);
   }
@@ -106,7 +292,7 @@ void processResponse(String response) {
     String mode = extractMode(response);
     digitalWrite(LED_MASTER, HIGH);
     displayMessage("MASTER KEY", "Mode: " + mode);
-    Serial.println(">>> MASTER KEY - Registration mode");
+    debugPrint(">>> MASTER KEY - Registration mode");
     delay(3000);
     digitalWrite(LED_MASTER, LOW);
   }
@@ -115,7 +301,7 @@ void processResponse(String response) {
     String userName = extractUserName(response);
     digitalWrite(LED_GRANTED, HIGH);
     displayMessage("REGISTERED", userName);
-    Serial.println(">>> NEW USER REGISTERED");
+    debugPrint(">>> NEW USER REGISTERED");
     delay(2000);
     digitalWrite(LED_GRANTED, LOW);
   }
@@ -123,7 +309,7 @@ void processResponse(String response) {
     // Ошибка
     digitalWrite(LED_DENIED, HIGH);
     displayMessage("ERROR", response);
-    Serial.println(">>> ERROR: " + response);
+    debugPrint(">>> ERROR: " + response);
     delay(3000);
     digitalWrite(LED_DENIED, LOW);
   }
@@ -4,12 +4,130 @@ import sqlite3
 import datetime
 import time
 import threading
-from typing import Optional, Tuple
+import sys
+import os
+import io
+import socket
+import tempfile
+import statistics
+import random
+import select
+from contextlib import redirect_stdout
+from typing import List, Optional, Tuple
 
-class NFCServer:
+# ==================== КОМПАКТНЫЙ ПРОТОКОЛ ====================
+# Кадр: 0x7E | тип | seq | длина | данные | CRC-8 (по типу, seq, длине и данным)
+
+TEXT_BAUDRATE = 9600
+FRAMED_BAUDRATE = 115200
+FRAME_START = 0x7E
+FRAME_MAX_PAYLOAD = 64      # совпадает с буфером приема в скетче
+
+# Чтение порта блокируется до прихода данных, но не дольше таймаута,
+# чтобы монитор успевал слать PING и проверять связь
+SERIAL_READ_TIMEOUT = 0.5
+SKETCH_TEXT_POLL = 0.1      # waitForResponse в скетче проверяет порт раз в 100 мс
+PING_INTERVAL = 2.0         # сервер шлет PING, скетч возвращает его с тем же seq
+LINK_TIMEOUT = 6.0          # без кадров дольше этого обе стороны возвращаются к тексту
+
+# Типы кадров
+FRAME_UID = ord('U')        # Arduino -> сервер: байты UID
+FRAME_GRANTED = ord('G')    # сервер -> Arduino: имя пользователя
+FRAME_DENIED = ord('D')
+FRAME_MASTER = ord('M')     # данные: 1 - режим регистрации включен, 0 - выключен
+FRAME_REGISTERED = ord('R')
+FRAME_ERROR = ord('E')
+FRAME_PING = ord('P')       # проверка связи в обе стороны
+
+def crc8(data: bytes) -> int:
+    """CRC-8 (полином 0x07), та же реализация есть в скетче"""
+    crc = 0
+    for byte in data:
+        crc ^= byte
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x07) & 0xFF if crc & 0x80 else (crc << 1) & 0xFF
+    return crc
+
+def encode_frame(frame_type: int, seq: int, payload: bytes = b'') -> bytes:
+    """Упаковка кадра"""
+    if len(payload) > FRAME_MAX_PAYLOAD:
+        raise ValueError(f"Frame payload too long: {len(payload)} > {FRAME_MAX_PAYLOAD} bytes")
+    body = bytes([frame_type, seq & 0xFF, len(payload)]) + payload
+    return bytes([FRAME_START]) + body + bytes([crc8(body)])
+
+def text_payload(text: str) -> bytes:
+    """Текст для кадра; длинные строки обрезаются по границе символа UTF-8"""
+    data = text.encode('utf-8')
+    if len(data) <= FRAME_MAX_PAYLOAD:
+        return data
+    return data[:FRAME_MAX_PAYLOAD].decode('utf-8', errors='ignore').encode('utf-8')
+
+def encode_response(seq: int, response: str) -> bytes:
+    """Перевод текстового ответа (ACCESS_GRANTED:...) в кадр с тем же seq"""
+    prefix, _, value = response.partition(':')
+    
+    if prefix == "ACCESS_GRANTED":
+        return encode_frame(FRAME_GRANTED, seq, text_payload(value))
+    if prefix == "ACCESS_DENIED":
+        return encode_frame(FRAME_DENIED, seq)
+    if prefix == "MASTER_KEY":
+        return encode_frame(FRAME_MASTER, seq, b'\x01' if value == "ACTIVE" else b'\x00')
+    if prefix == "REGISTERED":
+        return encode_frame(FRAME_REGISTERED, seq, text_payload(value))
+    return encode_frame(FRAME_ERROR, seq, text_payload(value))
+
+class FrameDecoder:
+    """Потоковый разбор кадров; мусор и кадры с неверной CRC отбрасываются"""
+    
     def __init__(self):
-        self.serial_port = self.find_arduino_port()
-        self.baudrate = 9600
+        self.buffer = bytearray()
+    
+    def feed(self, data: bytes) -> List[Tuple[int, int, bytes]]:
+        """Добавляет байты и возвращает готовые кадры (тип, seq, данные)"""
+        self.buffer.extend(data)
+        frames = []
+        
+        while True:
+            start = self.buffer.find(FRAME_START)
+            if start == -1:
+                self.buffer.clear()
+                break
+            del self.buffer[:start]
+            
+            if len(self.buffer) < 4:
+                break
+            
+            length = self.buffer[3]
+            if length > FRAME_MAX_PAYLOAD:
+                del self.buffer[0]
+                continue
+            
+            frame_size = 4 + length + 1
+            if len(self.buffer) < frame_size:
+                break
+            
+            body = bytes(self.buffer[1:4 + length])
+            if crc8(body) != self.buffer[4 + length]:
+                # Ложный стартовый байт - ищем следующий
+                del self.buffer[0]
+                continue
+            
+            frames.append((body[0], body[1], body[3:]))
+            del self.buffer[:frame_size]
+        
+        return frames
+
+class NFCServer:
+    def __init__(self, serial_port: Optional[str] = None):
+        self.serial_port = serial_port or self.find_arduino_port()
+        self.baudrate = TEXT_BAUDRATE
+        self.framed = False
+        self.decoder = FrameDecoder()
+        self.ping_seq = 0
+        self.last_frame_time = 0.0
+        self.last_ping_time = 0.0
+        self.running = False
+        self.line_buffer = b''
         self.ser = None
         self.registration_mode = False
         self.master_key = "34B226517F9E36"  #master-key
@@ -59,7 +177,7 @@ class NFCServer:
         for attempt in range(max_retries):
             try:
                 print(f"Attempt {attempt + 1} to connect to {self.serial_port}...")
-                self.ser = serial.Serial(self.serial_port, self.baudrate, timeout=1)
+                self.ser = serial.Serial(self.serial_port, self.baudrate, timeout=SERIAL_READ_TIMEOUT)
                 time.sleep(2)  # ждем инициализации Arduino
                 print(f"✅ Connected to {self.serial_port} at {self.baudrate} baud")
                 return True
@@ -76,6 +194,79 @@ class NFCServer:
         
         print("❌ All connection attempts failed")
         return False
+    
+    def set_protocol(self, framed: bool):
+        """Переключение порта между текстовым и компактным протоколом"""
+        self.framed = framed
+        self.baudrate = FRAMED_BAUDRATE if framed else TEXT_BAUDRATE
+        self.ser.baudrate = self.baudrate
+        self.decoder = FrameDecoder()
+        self.line_buffer = b''
+        self.last_frame_time = time.time()
+        self.last_ping_time = 0.0
+    
+    def negotiate_protocol(self):
+        """Переход на компактный протокол; если скетч его не знает, остаемся на тексте"""
+        # READY приходит после перезагрузки платы. Если плата не сбрасывается
+        # при открытии порта, READY не будет - протокол все равно предлагаем
+        deadline = time.time() + 3
+        while time.time() < deadline:
+            line = self.ser.readline().decode('utf-8', errors='ignore').strip()
+            if line == "READY":
+                break
+        
+        self.ser.write(f"PROTO:FRAMED:{FRAMED_BAUDRATE}\n".encode('utf-8'))
+        
+        deadline = time.time() + 1
+        while time.time() < deadline:
+            line = self.ser.readline().decode('utf-8', errors='ignore').strip()
+            if line == f"PROTO_OK:FRAMED:{FRAMED_BAUDRATE}":
+                self.set_protocol(True)
+                time.sleep(0.05)  # даем Arduino перенастроить порт
+                self.ser.reset_input_buffer()
+                print(f"✅ Framed protocol at {FRAMED_BAUDRATE} baud")
+                return True
+        
+        # PROTO_OK мог потеряться, или скетч остался в компактном режиме с прошлого запуска
+        if self.probe_framed():
+            print(f"✅ Framed protocol at {FRAMED_BAUDRATE} baud (already active on Arduino)")
+            return True
+        
+        print("⚠️  Firmware does not support framed protocol, using text protocol")
+        return False
+    
+    def probe_framed(self) -> bool:
+        """Проверка, отвечает ли скетч на PING на скорости компактного протокола"""
+        self.set_protocol(True)
+        self.ser.reset_input_buffer()
+        self.ping_seq = (self.ping_seq + 1) & 0xFF
+        self.send_frame(encode_frame(FRAME_PING, self.ping_seq))
+        
+        deadline = time.time() + 1
+        while time.time() < deadline:
+            data = self.ser.read(max(1, self.ser.in_waiting))
+            for frame_type, seq, _ in self.decoder.feed(data):
+                if frame_type == FRAME_PING and seq == self.ping_seq:
+                    return True
+        
+        self.set_protocol(False)
+        return False
+    
+    def check_link(self):
+        """PING в компактном режиме; если Arduino молчит - возврат к тексту"""
+        now = time.time()
+        
+        if now - self.last_frame_time > LINK_TIMEOUT:
+            # Скетч к этому моменту тоже вернулся на 9600 и прислал READY
+            print("⚠️  No frames from Arduino, falling back to text protocol")
+            self.set_protocol(False)
+            self.negotiate_protocol()
+            return
+        
+        if now - self.last_ping_time >= PING_INTERVAL:
+            self.ping_seq = (self.ping_seq + 1) & 0xFF
+            self.send_frame(encode_frame(FRAME_PING, self.ping_seq))
+            self.last_ping_time = now
 
    
     def log_access(self, uid: str, action: str):
@@ -163,6 +354,38 @@ class NFCServer:
             except serial.SerialException as e:
                 print(f"Send error: {e}")
     
+    def send_frame(self, frame: bytes):
+        """Отправка кадра в Arduino"""
+        if self.ser and self.ser.is_open:
+            try:
+                self.ser.write(frame)
+            except serial.SerialException as e:
+                print(f"Send error: {e}")
+    
+    def process_frames(self):
+        """Обработка входящих кадров; ответ несет seq запроса"""
+        # Ждем первый байт (до таймаута порта), затем забираем все накопившееся
+        data = bytearray(self.ser.read(1))
+        while self.ser.in_waiting > 0:
+            data.extend(self.ser.read(self.ser.in_waiting))
+        
+        for frame_type, seq, payload in self.decoder.feed(bytes(data)):
+            self.last_frame_time = time.time()
+            
+            # Ответ на наш PING только подтверждает связь
+            if frame_type != FRAME_UID:
+                continue
+            
+            uid = payload.hex().upper()
+            print(f"\nReceived UID: {uid} (seq {seq})")
+            
+            response, action = self.handle_uid(uid)
+            self.send_frame(encode_response(seq, response))
+            
+            print(f"Action: {action}")
+            print(f"Response: {response}")
+            print("-" * 40)
+    
     def list_users(self):
         """Показать всех пользователей"""
         conn = sqlite3.connect('nfc_database.db')
@@ -176,31 +399,43 @@ class NFCServer:
             print(f"ID: {user[0]}, UID: {user[1]}, Name: {user[2]}, Created: {user[3]}")
         print(f"Total: {len(users)} users\n")
     
+    def poll_serial(self):
+        """Одна итерация мониторинга: ожидание данных до таймаута порта и их обработка"""
+        if self.framed:
+            self.process_frames()
+            self.check_link()
+            return
+        
+        self.line_buffer += self.ser.readline()
+        if not self.line_buffer.endswith(b'\n'):
+            return  # таймаут посреди строки - дочитаем на следующей итерации
+        
+        line = self.line_buffer.decode('utf-8', errors='ignore').strip()
+        self.line_buffer = b''
+        
+        if line.startswith("UID:"):
+            uid = line[4:]  # извлекаем UID после "UID:"
+            print(f"\nReceived UID: {uid}")
+            
+            # обрабатываем UID
+            response, action = self.handle_uid(uid)
+            
+            # отправляем ответ в Arduino
+            self.send_to_arduino(response)
+            
+            # выводим в консоль
+            print(f"Action: {action}")
+            print(f"Response: {response}")
+            print("-" * 40)
+    
     def monitor_serial(self):
         """Мониторинг Serial порта"""
         print("Starting serial monitor...")
+        self.running = True
         
-        while True:
+        while self.running:
             try:
-                if self.ser and self.ser.in_waiting > 0:
-                    line = self.ser.readline().decode('utf-8').strip()
-                    
-                    if line.startswith("UID:"):
-                        uid = line[4:]  # извлекаем UID после "UID:"
-                        print(f"\nReceived UID: {uid}")
-                        
-                        # обрабатываем UID
-                        response, action = self.handle_uid(uid)
-                        
-                        # отправляем ответ в Arduino
-                        self.send_to_arduino(response)
-                        
-                        # выводим в консоль
-                        print(f"Action: {action}")
-                        print(f"Response: {response}")
-                        print("-" * 40)
-                
-                time.sleep(0.1)
+                self.poll_serial()
                 
             except KeyboardInterrupt:
                 print("\nStopping server...")
@@ -228,6 +463,8 @@ class NFCServer:
             print("4. Try running as Administrator")
             return
         
+        self.negotiate_protocol()
+        
         # запускаем мониторинг в отдельном потоке
         monitor_thread = threading.Thread(target=self.monitor_serial, daemon=True)
         monitor_thread.start()
@@ -263,7 +500,128 @@ class NFCServer:
             if self.ser:
                 self.ser.close()
 
+def board_scan_text(board: socket.socket, uid: str) -> Tuple[str, int]:
+    """Скан в текстовом протоколе со стороны платы; возвращает ответ и число байт"""
+    request = f"UID:{uid}\n".encode('utf-8')
+    board.sendall(request)
+    
+    # Как waitForResponse в скетче: проверка порта, иначе delay(100)
+    reply = b''
+    while not reply.endswith(b'\n'):
+        readable, _, _ = select.select([board], [], [], 0)
+        if not readable:
+            time.sleep(SKETCH_TEXT_POLL)
+            continue
+        
+        chunk = board.recv(256)
+        if not chunk:
+            raise RuntimeError("Connection closed by server")
+        reply += chunk
+    
+    return reply.decode('utf-8').strip(), len(request) + len(reply)
+
+def board_scan_framed(board: socket.socket, decoder: FrameDecoder, uid: str, seq: int) -> Tuple[str, int]:
+    """Скан в компактном протоколе со стороны платы; скетч читает порт без пауз"""
+    request = encode_frame(FRAME_UID, seq, bytes.fromhex(uid))
+    board.sendall(request)
+    
+    while True:
+        chunk = board.recv(256)
+        if not chunk:
+            raise RuntimeError("Connection closed by server")
+        
+        for frame_type, reply_seq, payload in decoder.feed(chunk):
+            if frame_type == FRAME_PING:
+                board.sendall(encode_frame(FRAME_PING, reply_seq))
+                continue
+            if reply_seq != seq:
+                raise RuntimeError(f"Reply seq {reply_seq} does not match request seq {seq}")
+            return chr(frame_type) + payload.decode('utf-8'), len(request) + 5 + len(payload)
+
+def benchmark_protocols(scans: int = 20) -> dict:
+    """Замер циклов скан -> ответ через виртуальный порт для обоих протоколов"""
+    uid = "04A1B2C3D45E80"
+    results = {}
+    # Сканы приходят в случайные моменты, а не сразу после предыдущего ответа
+    arrival = random.Random(0)
+    
+    # БД с журналом сканов создается во временной папке
+    previous_dir = os.getcwd()
+    workdir = tempfile.TemporaryDirectory()
+    os.chdir(workdir.name)
+    
+    # Плату изображает локальный сокет: loop:// вернул бы серверу его же ответы
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.bind(('127.0.0.1', 0))
+    listener.listen(1)
+    port = listener.getsockname()[1]
+    
+    try:
+        for framed in (False, True):
+            with redirect_stdout(io.StringIO()):
+                server = NFCServer(serial_port=f"socket://127.0.0.1:{port}")
+                server.init_database()
+                server.register_user(uid)
+                server.ser = serial.serial_for_url(server.serial_port, timeout=SERIAL_READ_TIMEOUT)
+            
+            board, _ = listener.accept()
+            board.settimeout(5)
+            server.set_protocol(framed)
+            
+            monitor = threading.Thread(target=server.monitor_serial, daemon=True)
+            timings = []
+            byte_count = 0
+            
+            with redirect_stdout(io.StringIO()):
+                monitor.start()
+                decoder = FrameDecoder()
+                for seq in range(1, scans + 1):
+                    time.sleep(arrival.uniform(0.0, 0.2))
+                    started = time.perf_counter()
+                    if framed:
+                        reply, byte_count = board_scan_framed(board, decoder, uid, seq)
+                    else:
+                        reply, byte_count = board_scan_text(board, uid)
+                    timings.append((time.perf_counter() - started) * 1000)
+                    
+                    if not reply.startswith(("ACCESS_GRANTED", "G")):
+                        raise RuntimeError(f"Unexpected reply: {reply}")
+                
+                server.running = False
+                monitor.join()
+            
+            server.ser.close()
+            board.close()
+            
+            baudrate = FRAMED_BAUDRATE if framed else TEXT_BAUDRATE
+            results['framed' if framed else 'text'] = {
+                'baudrate': baudrate,
+                'bytes': byte_count,
+                # Сервер, обмен через сокет и опрос порта скетчем
+                'host_ms': statistics.median(timings),
+                # UART 8N1 - 10 бит на байт; виртуальный порт скорость не эмулирует
+                'wire_ms': byte_count * 10 * 1000 / baudrate,
+            }
+    finally:
+        listener.close()
+        os.chdir(previous_dir)
+        workdir.cleanup()
+    
+    print(f"=== Serial protocol benchmark: {scans} scans, median UID -> response ===")
+    for name, result in results.items():
+        total = result['host_ms'] + result['wire_ms']
+        print(f"{name:<7} {result['bytes']:3d} bytes @ {result['baudrate']:6d} baud: "
+              f"measured {result['host_ms']:6.1f} ms + wire {result['wire_ms']:5.1f} ms = {total:6.1f} ms")
+    print("measured: same blocking server loop for both; board polls like the sketch "
+          f"(text: every {SKETCH_TEXT_POLL * 1000:.0f} ms, framed: continuously)")
+    
+    return results
+
 if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == 'bench':
+        benchmark_protocols()
+        sys.exit(0)
+    
     server = NFCServer()
 
     server.start()
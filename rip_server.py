@@ -1,22 +1,40 @@
-from flask import Flask, request, jsonify, render_template
+import time
+_import_started = time.perf_counter()  # для отчета о времени запуска
+
 import sqlite3
+import hashlib
 import datetime
 import threading
-import time
-from typing import Optional, Tuple
+import importlib
+from functools import wraps
+from typing import TYPE_CHECKING, Optional, Tuple
 import logging
 
-# Настройка логирования
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+# Flask импортируется в create_app() и в обработчиках, а не при импорте модуля
+if TYPE_CHECKING:
+    from flask import Flask
+
+# Логирование настраивается в create_app(), а не при импорте
 logger = logging.getLogger(__name__)
 
-app = Flask(__name__)
+# Маршруты собираются декоратором route() и регистрируются в create_app()
+ROUTES = []
+
+def route(rule: str, **options):
+    """Аналог bp.route, не требующий импорта Flask"""
+    def decorator(view):
+        ROUTES.append((rule, view, options))
+        return view
+    return decorator
 
 class NFCSystem:
     def __init__(self):
         self.master_key = "34B226517F9E36"  # ⬅️ ЗАМЕНИ НА СВОЙ UID МАСТЕР-КАРТЫ
         self.registration_mode = False
         self.access_log = []
+        # Версия данных - увеличивается при любом изменении, влияющем на ответы API
+        self.data_version = 0
+        self._version_lock = threading.Lock()
         self.init_database()
     
     def init_database(self):
@@ -52,6 +70,30 @@ class NFCSystem:
         conn.close()
         logger.info("Database initialized")
     
+    def bump_data_version(self):
+        """Инвалидация закэшированных ответов после изменения данных"""
+        with self._version_lock:
+            self.data_version += 1
+    
+    def get_data_version(self) -> Tuple[int, int]:
+        """Версия данных: локальный счетчик и счетчик изменений файла БД"""
+        # Счетчик в заголовке SQLite (байты 24-27) растет при каждой записи из любого
+        # процесса, поэтому учитываются и nfc_server.py, и другие воркеры
+        try:
+            with open('nfc_database.db', 'rb') as db_file:
+                db_file.seek(24)
+                db_counter = int.from_bytes(db_file.read(4), 'big')
+        except OSError:
+            db_counter = 0
+        
+        return self.data_version, db_counter
+    
+    def toggle_registration_mode(self) -> str:
+        """Переключение режима регистрации"""
+        self.registration_mode = not self.registration_mode
+        self.bump_data_version()
+        return "ACTIVE" if self.registration_mode else "INACTIVE"
+    
     def log_access(self, uid: str, action: str, result: str):
         """Логирование действий в базу данных"""
         conn = sqlite3.connect('nfc_database.db', check_same_thread=False)
@@ -74,6 +116,7 @@ class NFCSystem:
         if len(self.access_log) > 100:
             self.access_log.pop(0)
         
+        self.bump_data_version()
         logger.info(f"Access log: {uid} - {action} - {result}")
     
     def handle_nfc_scan(self, uid: str) -> Tuple[str, str]:
@@ -82,8 +125,7 @@ class NFCSystem:
         
         # Проверяем мастер-ключ
         if uid == self.master_key:
-            self.registration_mode = not self.registration_mode
-            mode_status = "ACTIVE" if self.registration_mode else "INACTIVE"
+            mode_status = self.toggle_registration_mode()
             response = f"MASTER_KEY:{mode_status}"
             action = "Master key authentication"
             result = f"Registration mode {mode_status}"
@@ -137,6 +179,7 @@ class NFCSystem:
             c.execute("INSERT INTO users (uid, name) VALUES (?, ?)", (uid, user_name))
             conn.commit()
             conn.close()
+            self.bump_data_version()
             logger.info(f"New user registered: {user_name} (UID: {uid})")
             return user_name
         except sqlite3.IntegrityError as e:
@@ -201,6 +244,7 @@ class NFCSystem:
             c.execute("DELETE FROM users WHERE id = ?", (user_id,))
             conn.commit()
             conn.close()
+            self.bump_data_version()
             logger.info(f"User {user_id} deleted")
             return True
         except Exception as e:
@@ -228,35 +272,319 @@ class NFCSystem:
             'server_uptime': get_uptime()
         }
 
-# Глобальный экземпляр системы
-nfc_system = NFCSystem()
+# Экземпляр системы создается при первом обращении (get_nfc_system)
+_nfc_system = None
+_nfc_system_lock = threading.Lock()
+
+# Время запуска сервера (задается в create_app)
+start_time = None
 
-# Время запуска сервера
-start_time = datetime.datetime.now()
+def get_nfc_system() -> NFCSystem:
+    """Ленивое создание NFCSystem (инициализация БД) при первом использовании"""
+    global _nfc_system
+    if _nfc_system is None:
+        with _nfc_system_lock:
+            if _nfc_system is None:
+                _nfc_system = NFCSystem()
+    return _nfc_system
+
+def __getattr__(name):
+    """Совместимость: rip_server.nfc_system и rip_server.app создаются по запросу"""
+    if name == 'nfc_system':
+        return get_nfc_system()
+    if name == 'app':
+        global app
+        app = create_app()
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 def get_uptime():
     """Получение времени работы сервера"""
+    if start_time is None:
+        return "00:00:00"
     uptime = datetime.datetime.now() - start_time
     hours, remainder = divmod(int(uptime.total_seconds()), 3600)
     minutes, seconds = divmod(remainder, 60)
     return f"{hours:02d}:{minutes:02d}:{seconds:02d}"
 
+# ==================== КЭШ ОТВЕТОВ ====================
+
+class ResponseCache:
+    """Кэш сериализованных ответов, привязанный к версии данных"""
+    
+    def __init__(self, max_entries: int = 64):
+        self.max_entries = max_entries
+        self._entries = {}
+        self._lock = threading.Lock()
+    
+    def get(self, key, version) -> Optional[Tuple[bytes, str]]:
+        """Получение ответа, если он построен для текущей версии данных"""
+        with self._lock:
+            entry = self._entries.get(key)
+        
+        if entry is None:
+            return None
+        
+        entry_version, expires_at, body, etag = entry
+        if entry_version != version:
+            return None
+        if expires_at is not None and time.monotonic() >= expires_at:
+            return None
+        
+        return body, etag
+    
+    def put(self, key, version, body: bytes, ttl: Optional[float] = None) -> Tuple[bytes, str]:
+        """Сохранение ответа; ETag строится по содержимому"""
+        etag = hashlib.sha1(body).hexdigest()
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+        
+        with self._lock:
+            # Ключи зависят от параметров запроса (limit), поэтому ограничиваем размер
+            if key not in self._entries and len(self._entries) >= self.max_entries:
+                self._entries.pop(next(iter(self._entries)))
+            self._entries[key] = (version, expires_at, body, etag)
+        
+        return body, etag
+
+    def fetch(self, key, version, build_body, ttl: Optional[float] = None) -> Tuple[bytes, str]:
+        """Ответ из кэша или построение нового через build_body()"""
+        entry = self.get(key, version)
+        if entry is not None:
+            return entry
+        
+        body = build_body()
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        return self.put(key, version, body, ttl)
+
+response_cache = ResponseCache()
+
+# Запасное время жизни для данных БД: счетчик изменений не растет, например, в режиме WAL
+SHARED_DATA_TTL = 10.0
+
+def cached_response(key, build_body, mimetype: str = 'application/json', ttl: Optional[float] = None):
+    """Ответ из кэша с поддержкой ETag и If-None-Match"""
+    from flask import Response, request
+    
+    # Версию читаем до построения ответа: если данные изменятся в процессе,
+    # запись сразу окажется устаревшей и будет перестроена
+    version = get_nfc_system().get_data_version()
+    body, etag = response_cache.fetch(key, version, build_body, ttl)
+    
+    # If-None-Match сравнивается слабо (RFC 9110): прокси может пометить ETag как W/
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+    else:
+        response = Response(body, mimetype=mimetype)
+    
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+def build_users_body() -> str:
+    """JSON списка пользователей для /api/users"""
+    from flask import json
+    
+    return json.dumps(get_nfc_system().get_all_users())
+
+# ==================== КОНТРОЛЬ НАГРУЗКИ ====================
+
+class TokenBucket:
+    """Ограничение частоты запросов от одного источника"""
+    
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+    
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+    
+    def take(self) -> float:
+        """Забирает токен; возвращает 0 или сколько секунд ждать следующего"""
+        self.refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+class AdmissionController:
+    """Допуск запросов: сканы /nfc обслуживаются в приоритете перед чтением /api"""
+    
+    def __init__(self, max_in_flight: int = 8, max_scans_in_flight: int = 4,
+                 reserved_for_scans: int = 2, scan_rate: float = 5.0, scan_burst: int = 10,
+                 address_rate: float = 10.0, address_burst: int = 20,
+                 scan_wait: float = 0.2, read_wait: float = 1.0, max_sources: int = 1024):
+        self.max_in_flight = max_in_flight
+        self.max_scans_in_flight = max_scans_in_flight
+        self.reserved_for_scans = reserved_for_scans
+        self.scan_rate = scan_rate
+        self.scan_burst = scan_burst
+        self.address_rate = address_rate
+        self.address_burst = address_burst
+        self.wait_timeout = {'scan': scan_wait, 'read': read_wait}
+        self.max_sources = max_sources
+        
+        self.in_flight = {'scan': 0, 'read': 0}
+        self.scans_waiting = 0
+        self.buckets = {}
+        self.stats = {lane: {'admitted': 0, 'shed': 0, 'rate_limited': 0}
+                      for lane in ('scan', 'read')}
+        self._cond = threading.Condition()
+    
+    def check_rate(self, address: str, reader_id: str = '') -> float:
+        """Проверка лимитов адреса и считывателя; 0 - можно, иначе пауза в секундах"""
+        with self._cond:
+            # reader_id задает клиент, поэтому сначала общий лимит адреса:
+            # новый reader_id не дает нового запаса токенов
+            retry_after = self._get_bucket(('address', address),
+                                           self.address_rate, self.address_burst).take()
+            if not retry_after:
+                retry_after = self._get_bucket(('reader', address, reader_id),
+                                               self.scan_rate, self.scan_burst).take()
+            
+            if retry_after:
+                self.stats['scan']['rate_limited'] += 1
+            return retry_after
+    
+    def _get_bucket(self, key, rate: float, capacity: float) -> TokenBucket:
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            if len(self.buckets) >= self.max_sources:
+                self._prune_buckets()
+            bucket = TokenBucket(rate, capacity)
+            self.buckets[key] = bucket
+        return bucket
+    
+    def _prune_buckets(self):
+        """Удаление полностью восстановившихся корзин (источник давно молчит)"""
+        for key, bucket in list(self.buckets.items()):
+            bucket.refill()
+            if bucket.tokens >= bucket.capacity:
+                del self.buckets[key]
+        
+        # Все корзины активны - вытесняем самые старые
+        while len(self.buckets) >= self.max_sources:
+            self.buckets.pop(next(iter(self.buckets)))
+    
+    def _has_slot(self, lane: str) -> bool:
+        total = self.in_flight['scan'] + self.in_flight['read']
+        if lane == 'scan':
+            return total < self.max_in_flight and self.in_flight['scan'] < self.max_scans_in_flight
+        # Чтение не занимает резерв сканов и уступает ожидающим сканам, но только
+        # если скан может занять общий слот, а не упирается в собственный лимит
+        scans_blocked_by_cap = self.in_flight['scan'] >= self.max_scans_in_flight
+        return (total < self.max_in_flight - self.reserved_for_scans
+                and (self.scans_waiting == 0 or scans_blocked_by_cap))
+    
+    def acquire(self, lane: str) -> bool:
+        """Ожидание свободного слота; False - запрос нужно отклонить"""
+        deadline = time.monotonic() + self.wait_timeout[lane]
+        
+        with self._cond:
+            if lane == 'scan':
+                self.scans_waiting += 1
+            try:
+                while not self._has_slot(lane):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.stats[lane]['shed'] += 1
+                        return False
+                    self._cond.wait(remaining)
+                
+                self.in_flight[lane] += 1
+                self.stats[lane]['admitted'] += 1
+                return True
+            finally:
+                if lane == 'scan':
+                    self.scans_waiting -= 1
+                    # Чтения ждут, пока есть ожидающие сканы - будим их
+                    self._cond.notify_all()
+    
+    def release(self, lane: str):
+        with self._cond:
+            self.in_flight[lane] -= 1
+            self._cond.notify_all()
+    
+    def get_stats(self):
+        with self._cond:
+            return {
+                'in_flight': dict(self.in_flight),
+                'scans_waiting': self.scans_waiting,
+                'tracked_sources': len(self.buckets),
+                'lanes': {lane: dict(counts) for lane, counts in self.stats.items()}
+            }
+
+admission = AdmissionController()
+
+def busy_response(lane: str, retry_after: float, status: int = 503):
+    """Быстрый отказ: клиент /nfc может повторить скан через BUSY:<мс>"""
+    from flask import Response, jsonify
+    
+    retry_ms = max(100, int(retry_after * 1000))
+    
+    if lane == 'scan':
+        response = Response(f"BUSY:{retry_ms}", status=status, mimetype='text/plain')
+    else:
+        response = jsonify({"status": "error", "message": "Server busy", "retry_ms": retry_ms})
+        response.status_code = status
+    
+    response.headers['Retry-After'] = str(max(1, round(retry_after)))
+    return response
+
+def admission_lane(lane: str):
+    """Декоратор маршрута: ограничение частоты (для сканов) и числа запросов в обработке"""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if lane == 'scan':
+                from flask import request
+                
+                reader_id = request.form.get('reader_id') or request.headers.get('X-Reader-ID', '')
+                retry_after = admission.check_rate(request.remote_addr, reader_id)
+                if retry_after:
+                    return busy_response(lane, retry_after, status=429)
+            
+            if not admission.acquire(lane):
+                return busy_response(lane, admission.wait_timeout[lane])
+            
+            try:
+                return view(*args, **kwargs)
+            finally:
+                admission.release(lane)
+        return wrapper
+    return decorator
+
 # ==================== FLASK ROUTES ====================
 
-@app.route('/')
+@route('/')
+@admission_lane('read')
 def index():
     """Главная страница с веб-интерфейсом"""
-    system_status = nfc_system.get_system_status()
-    recent_logs = nfc_system.get_access_logs(10)
+    from flask import render_template
+    
+    def render():
+        nfc_system = get_nfc_system()
+        system_status = nfc_system.get_system_status()
+        recent_logs = nfc_system.get_access_logs(10)
+        
+        return render_template('index.html', 
+                             status=system_status,
+                             logs=recent_logs,
+                             registration_mode=nfc_system.registration_mode)
     
-    return render_template('index.html', 
-                         status=system_status,
-                         logs=recent_logs,
-                         registration_mode=nfc_system.registration_mode)
+    # Страница показывает время работы, поэтому храним ее не дольше секунды
+    return cached_response('index', render, mimetype='text/html', ttl=1.0)
 
-@app.route('/nfc', methods=['POST'])
+@route('/nfc', methods=['POST'])
+@admission_lane('scan')
 def handle_nfc():
     """Основной endpoint для обработки NFC запросов"""
+    from flask import request
+    
     try:
         uid = request.form.get('uid')
         
@@ -265,45 +593,56 @@ def handle_nfc():
         
         logger.info(f"Received NFC scan: {uid}")
         
-        response, result = nfc_system.handle_nfc_scan(uid)
+        response, result = get_nfc_system().handle_nfc_scan(uid)
         return response
         
     except Exception as e:
         logger.error(f"Error processing NFC request: {e}")
         return "ERROR: Internal server error", 500
 
-@app.route('/api/users', methods=['GET'])
+@route('/api/users', methods=['GET'])
+@admission_lane('read')
 def get_users():
     """API для получения списка пользователей"""
-    users = nfc_system.get_all_users()
-    return jsonify(users)
+    return cached_response('users', build_users_body, ttl=SHARED_DATA_TTL)
 
-@app.route('/api/users/<int:user_id>', methods=['DELETE'])
+@route('/api/users/<int:user_id>', methods=['DELETE'])
 def delete_user(user_id):
     """API для удаления пользователя"""
-    if nfc_system.delete_user(user_id):
+    from flask import jsonify
+    
+    if get_nfc_system().delete_user(user_id):
         return jsonify({"status": "success", "message": "User deleted"})
     else:
         return jsonify({"status": "error", "message": "Failed to delete user"}), 500
 
-@app.route('/api/logs', methods=['GET'])
+@route('/api/logs', methods=['GET'])
+@admission_lane('read')
 def get_logs():
     """API для получения логов"""
+    from flask import request, json
+    
     limit = request.args.get('limit', 50, type=int)
-    logs = nfc_system.get_access_logs(limit)
-    return jsonify(logs)
+    return cached_response(('logs', limit),
+                           lambda: json.dumps(get_nfc_system().get_access_logs(limit)),
+                           ttl=SHARED_DATA_TTL)
 
-@app.route('/api/status', methods=['GET'])
+@route('/api/status', methods=['GET'])
+@admission_lane('read')
 def get_status():
     """API для получения статуса системы"""
-    status = nfc_system.get_system_status()
-    return jsonify(status)
+    from flask import json
+    
+    # Статус содержит время работы и счетчик за сегодня - кэшируем не дольше секунды
+    return cached_response('status', lambda: json.dumps(get_nfc_system().get_system_status()), ttl=1.0)
 
-@app.route('/api/registration', methods=['POST'])
+@route('/api/registration', methods=['POST'])
 def toggle_registration():
     """API для переключения режима регистрации"""
-    nfc_system.registration_mode = not nfc_system.registration_mode
-    mode_status = "ACTIVE" if nfc_system.registration_mode else "INACTIVE"
+    from flask import jsonify
+    
+    nfc_system = get_nfc_system()
+    mode_status = nfc_system.toggle_registration_mode()
     
     nfc_system.log_access("SYSTEM", "Registration mode toggle", f"Mode set to {mode_status}")
     
@@ -313,14 +652,23 @@ def toggle_registration():
         "message": f"Registration mode {mode_status}"
     })
 
-@app.route('/api/master_key', methods=['GET'])
+@route('/api/admission', methods=['GET'])
+def get_admission_stats():
+    """API для статистики допуска запросов (принятые и отклоненные)"""
+    from flask import jsonify
+    
+    return jsonify(admission.get_stats())
+
+@route('/api/master_key', methods=['GET'])
 def get_master_key():
     """API для получения информации о мастер-ключе"""
-    return jsonify({"master_key": nfc_system.master_key})
+    from flask import jsonify
+    
+    return jsonify({"master_key": get_nfc_system().master_key})
 
 # ==================== HTML TEMPLATE ====================
 
-@app.route('/template')
+@route('/template')
 def template():
     """Страница с HTML шаблоном для отладки"""
     return '''
@@ -410,14 +758,66 @@ def template():
 
 # ==================== ЗАПУСК СЕРВЕРА ====================
 
+def create_app(warm_up: bool = True) -> "Flask":
+    """Фабрика приложения: импортирует Flask, создает приложение и прогревает его"""
+    global start_time
+    timings = [("module import", _import_ms)]
+    
+    def timed(stage, func):
+        started = time.perf_counter()
+        result = func()
+        timings.append((stage, (time.perf_counter() - started) * 1000))
+        return result
+    
+    timed("logging", lambda: logging.basicConfig(
+        level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s'))
+    
+    flask = timed("flask import", lambda: importlib.import_module('flask'))
+    
+    def build_app():
+        blueprint = flask.Blueprint('nfc', __name__)
+        for rule, view, options in ROUTES:
+            blueprint.add_url_rule(rule, view_func=view, **options)
+        
+        flask_app = flask.Flask(__name__)
+        flask_app.register_blueprint(blueprint)
+        return flask_app
+    
+    flask_app = timed("flask app", build_app)
+    
+    if warm_up:
+        # Прогрев того, что нужно первому запросу, до приема трафика: схема БД,
+        # скомпилированная карта URL и окружение Jinja. Кэш пользователей не прогревается:
+        # пользователей меняют nfc_server.py и другие воркеры, согласованный кэш в памяти
+        # процесса невозможен, поэтому доступ всегда проверяется по БД
+        timed("database", get_nfc_system)
+        timed("url map", lambda: flask_app.url_map.bind('localhost').match('/nfc', method='POST'))
+        timed("jinja env", lambda: flask_app.jinja_env)
+        logger.info("Warm-up complete: database, URL map, Jinja environment")
+    
+    start_time = datetime.datetime.now()
+    
+    logger.info("Startup timing:")
+    for stage, elapsed in timings:
+        logger.info(f"  {stage:<14} {elapsed:8.1f} ms")
+    logger.info(f"  {'total':<14} {sum(elapsed for _, elapsed in timings):8.1f} ms")
+    
+    return flask_app
+
+# Время импорта модуля без Flask - первая строка отчета create_app()
+_import_ms = (time.perf_counter() - _import_started) * 1000
+
 if __name__ == '__main__':
+    app = create_app()
+    
     logger.info("=== Starting NFC Access Control Server ===")
-    logger.info(f"Master Key UID: {nfc_system.master_key}")
+    logger.info(f"Master Key UID: {get_nfc_system().master_key}")
     logger.info("Server will run on http://0.0.0.0:8000")
     logger.info("Available endpoints:")
     logger.info("  POST /nfc - Process NFC scan")
     logger.info("  GET  /api/users - Get all users")
     logger.info("  GET  /api/status - Get system status")
+    logger.info("  GET  /api/admission - Get admitted/shed request counts")
     logger.info("  GET  /template - Web interface")
     logger.info("=" * 50)
     
@@ -0,0 +1,99 @@
+import pytest
+import serial
+
+import nfc_server
+from nfc_server import (FRAME_GRANTED, FRAME_MAX_PAYLOAD, FRAME_PING, FRAME_REGISTERED,
+                        FRAME_UID, FrameDecoder, NFCServer, crc8, encode_frame,
+                        encode_response)
+
+
+def test_crc8_check_value():
+    # Контрольное значение CRC-8 (полином 0x07) для "123456789"
+    assert crc8(b"123456789") == 0xF4
+
+
+def test_frame_roundtrip():
+    frame = encode_frame(FRAME_UID, 5, bytes.fromhex('04A1B2C3'))
+    assert FrameDecoder().feed(frame) == [(FRAME_UID, 5, bytes.fromhex('04A1B2C3'))]
+
+
+def test_decoder_resyncs_after_garbage():
+    frame = encode_frame(FRAME_PING, 7)
+    garbage = b'Server: ACCESS_GRANTED\r\n\x7e\x01'
+    assert FrameDecoder().feed(garbage + frame) == [(FRAME_PING, 7, b'')]
+
+
+def test_decoder_drops_frame_with_bad_crc():
+    bad = bytearray(encode_frame(FRAME_UID, 1, b'\x01\x02'))
+    bad[-1] ^= 0xFF
+    good = encode_frame(FRAME_UID, 2, b'\x03')
+
+    assert FrameDecoder().feed(bytes(bad) + good) == [(FRAME_UID, 2, b'\x03')]
+
+
+def test_decoder_handles_split_feed():
+    frame = encode_frame(FRAME_GRANTED, 3, b'User_1')
+    decoder = FrameDecoder()
+
+    assert decoder.feed(frame[:2]) == []
+    assert decoder.feed(frame[2:6]) == []
+    assert decoder.feed(frame[6:]) == [(FRAME_GRANTED, 3, b'User_1')]
+
+
+def test_encode_frame_rejects_oversized_payload():
+    with pytest.raises(ValueError):
+        encode_frame(FRAME_GRANTED, 1, b'x' * (FRAME_MAX_PAYLOAD + 1))
+
+
+def test_already_registered_response_fits_in_frame():
+    response = "REGISTERED:Already registered as User_20250101_120000"
+    [(frame_type, seq, payload)] = FrameDecoder().feed(encode_response(9, response))
+
+    assert (frame_type, seq) == (FRAME_REGISTERED, 9)
+    assert payload.decode('utf-8') == "Already registered as User_20250101_120000"
+
+
+def test_long_text_is_cut_on_character_boundary():
+    response = "ACCESS_GRANTED:" + "Ж" * FRAME_MAX_PAYLOAD
+    [(_, _, payload)] = FrameDecoder().feed(encode_response(1, response))
+
+    assert len(payload) <= FRAME_MAX_PAYLOAD
+    assert payload.decode('utf-8') == "Ж" * (FRAME_MAX_PAYLOAD // 2)
+
+
+def test_process_frames_replies_with_request_seq(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    server = NFCServer(serial_port='loop://')
+    server.init_database()
+    server.register_user('04A1B2C3')
+    server.ser = serial.serial_for_url('loop://', timeout=0.1)
+    server.set_protocol(True)
+
+    server.ser.write(encode_frame(FRAME_UID, 42, bytes.fromhex('04A1B2C3')))
+    server.process_frames()
+
+    [(frame_type, seq, payload)] = FrameDecoder().feed(server.ser.read(server.ser.in_waiting))
+    assert (frame_type, seq) == (FRAME_GRANTED, 42)
+    assert payload.decode('utf-8').startswith('User_')
+
+
+def test_benchmark_runs_both_protocols():
+    results = nfc_server.benchmark_protocols(scans=2)
+    assert set(results) == {'text', 'framed'}
+    assert results['framed']['bytes'] < results['text']['bytes']
+
+
+def test_text_line_split_by_read_timeout_is_reassembled(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    server = NFCServer(serial_port='loop://')
+    server.init_database()
+    server.ser = serial.serial_for_url('loop://', timeout=0.05)
+    server.set_protocol(False)
+
+    server.ser.write(b'UID:04A1')
+    server.poll_serial()
+    assert server.ser.in_waiting == 0
+
+    server.ser.write(b'B2C3\n')
+    server.poll_serial()
+    assert server.ser.readline() == b'ACCESS_DENIED\n'
@@ -0,0 +1,276 @@
+import os
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+import rip_server
+from rip_server import ResponseCache
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    """Flask-клиент с отдельной БД во временной папке"""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(rip_server, '_nfc_system', None)
+    monkeypatch.setattr(rip_server, 'response_cache', ResponseCache())
+    app = rip_server.create_app(warm_up=False)
+    return app.test_client()
+
+
+def add_user_externally(uid, name):
+    """Запись в БД из отдельного соединения, как это делает nfc_server.py"""
+    conn = sqlite3.connect('nfc_database.db')
+    conn.execute("INSERT INTO users (uid, name) VALUES (?, ?)", (uid, name))
+    conn.commit()
+    conn.close()
+
+
+# ==================== ResponseCache ====================
+
+def test_response_cache_hit_for_same_version():
+    cache = ResponseCache()
+    body, etag = cache.put('users', 1, b'[]')
+    assert cache.get('users', 1) == (body, etag)
+
+
+def test_response_cache_miss_on_version_mismatch():
+    cache = ResponseCache()
+    cache.put('users', 1, b'[]')
+    assert cache.get('users', 2) is None
+
+
+def test_response_cache_ttl_expiry(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(rip_server.time, 'monotonic', lambda: now[0])
+    cache = ResponseCache()
+    cache.put('status', 1, b'{}', ttl=1.0)
+
+    now[0] = 100.5
+    assert cache.get('status', 1) is not None
+    now[0] = 101.0
+    assert cache.get('status', 1) is None
+
+
+def test_response_cache_evicts_oldest_entry():
+    cache = ResponseCache(max_entries=2)
+    cache.put(('logs', 1), 1, b'a')
+    cache.put(('logs', 2), 1, b'b')
+    cache.put(('logs', 3), 1, b'c')
+
+    assert cache.get(('logs', 1), 1) is None
+    assert cache.get(('logs', 2), 1) is not None
+    assert cache.get(('logs', 3), 1) is not None
+
+
+def test_response_cache_etag_depends_on_content():
+    cache = ResponseCache()
+    _, etag_a = cache.put('a', 1, b'[1]')
+    _, etag_b = cache.put('b', 2, b'[1]')
+    _, etag_c = cache.put('c', 1, b'[2]')
+    assert etag_a == etag_b != etag_c
+
+
+def test_response_cache_fetch_builds_once():
+    cache = ResponseCache()
+    calls = []
+
+    def build():
+        calls.append(1)
+        return '[]'
+
+    assert cache.fetch('users', 1, build)[0] == b'[]'
+    cache.fetch('users', 1, build)
+    assert len(calls) == 1
+
+
+# ==================== ETag / If-None-Match ====================
+
+def test_if_none_match_returns_304(client):
+    first = client.get('/api/users')
+    assert first.status_code == 200
+    assert first.headers['ETag']
+
+    second = client.get('/api/users', headers={'If-None-Match': first.headers['ETag']})
+    assert second.status_code == 304
+    assert second.data == b''
+    assert second.headers['ETag'] == first.headers['ETag']
+
+
+def test_stale_etag_gets_full_response(client):
+    first = client.get('/api/users')
+    rip_server.get_nfc_system().register_user('04A1B2C3')
+
+    second = client.get('/api/users', headers={'If-None-Match': first.headers['ETag']})
+    assert second.status_code == 200
+    assert second.headers['ETag'] != first.headers['ETag']
+
+
+def test_weak_if_none_match_returns_304(client):
+    etag = client.get('/api/users').headers['ETag']
+
+    # Прокси (например, nginx с gzip) ослабляет ETag до W/"..."
+    response = client.get('/api/users', headers={'If-None-Match': f'W/{etag}'})
+    assert response.status_code == 304
+
+
+def test_external_write_invalidates_cache(client):
+    assert client.get('/api/users').get_json() == []
+
+    add_user_externally('04A1B2C3', 'External')
+
+    users = client.get('/api/users').get_json()
+    assert [user['name'] for user in users] == ['External']
+
+
+# ==================== TokenBucket / AdmissionController ====================
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Управляемое время для корзин токенов"""
+    now = [1000.0]
+    monkeypatch.setattr(rip_server.time, 'monotonic', lambda: now[0])
+    return now
+
+
+def test_token_bucket_burst_then_refill(clock):
+    bucket = rip_server.TokenBucket(rate=2.0, capacity=3)
+
+    assert [bucket.take() for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert bucket.take() == pytest.approx(0.5)
+
+    clock[0] += 0.5
+    assert bucket.take() == 0.0
+
+
+def test_token_bucket_does_not_exceed_capacity(clock):
+    bucket = rip_server.TokenBucket(rate=1.0, capacity=2)
+    clock[0] += 100
+    assert [bucket.take() for _ in range(3)][-1] > 0
+
+
+def test_reads_cannot_use_reserved_scan_slots():
+    admission = rip_server.AdmissionController(max_in_flight=3, reserved_for_scans=1,
+                                               scan_wait=0, read_wait=0)
+
+    assert admission.acquire('read')
+    assert admission.acquire('read')
+    assert not admission.acquire('read')
+    assert admission.acquire('scan')
+
+    stats = admission.get_stats()
+    assert stats['in_flight'] == {'scan': 1, 'read': 2}
+    assert stats['lanes']['read'] == {'admitted': 2, 'shed': 1, 'rate_limited': 0}
+
+
+def test_scans_limited_by_own_cap():
+    admission = rip_server.AdmissionController(max_in_flight=8, max_scans_in_flight=2,
+                                               scan_wait=0)
+
+    assert admission.acquire('scan')
+    assert admission.acquire('scan')
+    assert not admission.acquire('scan')
+
+    admission.release('scan')
+    assert admission.acquire('scan')
+    assert admission.get_stats()['lanes']['scan'] == {'admitted': 3, 'shed': 1, 'rate_limited': 0}
+
+
+def test_reads_not_blocked_by_scan_waiting_on_its_own_cap():
+    admission = rip_server.AdmissionController(scan_wait=1.0, read_wait=0)
+    for _ in range(admission.max_scans_in_flight):
+        assert admission.acquire('scan')
+
+    # Пятый скан ждет собственного лимита - общий слот он занять не может
+    scan = threading.Thread(target=admission.acquire, args=('scan',))
+    scan.start()
+    while admission.get_stats()['scans_waiting'] == 0:
+        time.sleep(0.001)
+
+    assert admission.acquire('read')
+    admission.release('scan')
+    scan.join()
+
+
+def test_read_wakes_when_waiting_scan_gives_up():
+    class StuckScans(rip_server.AdmissionController):
+        """Скан ждет общего слота, хотя чтению места хватает"""
+        def _has_slot(self, lane):
+            return lane != 'scan' and super()._has_slot(lane)
+
+    admission = StuckScans(scan_wait=0.1, read_wait=2.0)
+
+    scan = threading.Thread(target=admission.acquire, args=('scan',))
+    scan.start()
+    while admission.get_stats()['scans_waiting'] == 0:
+        time.sleep(0.001)
+
+    started = time.monotonic()
+    assert admission.acquire('read')
+    assert time.monotonic() - started < 1.0
+    scan.join()
+
+
+def test_new_reader_id_does_not_bypass_address_limit(clock):
+    admission = rip_server.AdmissionController(scan_rate=1.0, scan_burst=2,
+                                               address_rate=1.0, address_burst=3)
+
+    assert admission.check_rate('10.0.0.1', 'BB') == 0
+    assert admission.check_rate('10.0.0.1', 'BB') == 0
+    assert admission.check_rate('10.0.0.1', 'BB') > 0
+    assert admission.check_rate('10.0.0.1', 'x1') > 0
+    assert admission.check_rate('10.0.0.2', 'x1') == 0
+    assert admission.get_stats()['lanes']['scan']['rate_limited'] == 2
+
+
+def test_bucket_table_is_bounded(clock):
+    admission = rip_server.AdmissionController(max_sources=4)
+    for i in range(10):
+        admission.check_rate(f'10.0.0.{i}')
+    assert admission.get_stats()['tracked_sources'] <= 4
+
+
+def test_nfc_rate_limited_returns_busy(client, monkeypatch):
+    monkeypatch.setattr(rip_server, 'admission',
+                        rip_server.AdmissionController(scan_burst=1, address_burst=1))
+
+    assert client.post('/nfc', data={'uid': '04A1B2C3', 'reader_id': 'BB'}).status_code == 200
+
+    response = client.post('/nfc', data={'uid': '04A1B2C3', 'reader_id': 'x1'})
+    assert response.status_code == 429
+    assert response.data.startswith(b'BUSY:')
+    assert 'Retry-After' in response.headers
+
+
+# ==================== create_app / проверка доступа ====================
+
+def test_access_follows_external_writes(client):
+    rip_server.get_nfc_system()
+    add_user_externally('04A1B2C3', 'External')
+    assert client.post('/nfc', data={'uid': '04A1B2C3'}).data == b'ACCESS_GRANTED:External'
+
+    conn = sqlite3.connect('nfc_database.db')
+    conn.execute("DELETE FROM users")
+    conn.commit()
+    conn.close()
+    assert client.post('/nfc', data={'uid': '04A1B2C3'}).data == b'ACCESS_DENIED'
+
+
+def test_warm_up_prepares_database_and_app(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(rip_server, '_nfc_system', None)
+
+    app = rip_server.create_app()
+
+    assert rip_server._nfc_system is not None
+    assert (tmp_path / 'nfc_database.db').exists()
+    assert app.url_map.bind('localhost').match('/api/status') == ('nfc.get_status', {})
+
+
+def test_import_does_not_load_flask():
+    code = "import sys, rip_server; sys.exit('flask' in sys.modules or rip_server._nfc_system is not None)"
+    result = subprocess.run([sys.executable, '-c', code], cwd=os.path.dirname(rip_server.__file__))
+    assert result.returncode == 0